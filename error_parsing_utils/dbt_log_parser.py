@@ -1,9 +1,21 @@
-import json
+import functools
 import logging
+import os
+import re
 
+import numpy as np
 import pandas as pd
 from error_parsing_utils.dbt_manifest_graph import Manifest
-from textwrap import fill
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    from json import loads as json_loads
+
+try:
+    import ijson
+except ImportError:  # ijson is optional, run_results.json is decoded in one go without it
+    ijson = None
 
 
 """
@@ -26,54 +38,101 @@ RUN_RESULTS_FILE_PATH = "../../../../dbt/target/run_results.json"
 # Default Slack Channel ID
 DEFAULT_SLACK_ID = "C0514AZSN9Z"
 
+# Resource types kept from the manifest, mirrors the Manifest.filter validator
+MANIFEST_RESOURCE_TYPES = ("test", "snapshot", "model")
+
+# Columns read from each manifest node, depends_on holding only the first dependency
+MANIFEST_COLUMNS = ["node", "description", "path", "unique_id", "depends_on"]
+
+# Patterns used to pull the data owner and Slack Channel ID out of node descriptions
+DESCRIPTION_PATTERN = re.compile(
+    r"Data Owner:\s*(?P<model_owner>[A-Z0-9]+).*?Slack Channel ID:\s*(?P<slack_id>[A-Z0-9]+)",
+    re.DOTALL,
+)
+DATA_OWNER_PATTERN = re.compile(r"Data Owner:\s*(?P<model_owner>[A-Z0-9]+)")
+SLACK_ID_PATTERN = re.compile(r"Slack Channel ID:\s*(?P<slack_id>[A-Z0-9]+)")
+
+# Columns read from each run_results.json result
+RUN_RESULTS_COLUMNS = ["node", "status", "timing", "result", "message"]
+
+# Columns returned by JoinDf, in output order
+JOIN_OUTPUT_COLUMNS = [
+    "clean_node_name",
+    "depends_on",
+    "status",
+    "result",
+    "message",
+    "process_type",
+    "model_owner",
+    "slack_id",
+    "path",
+]
+
 # Class to process data from imported Manifest class
 class ManifestProcessor:
-    def __init__(self, data: dict):
+    def __init__(self, data: pd.DataFrame):
         self.data = data
 
     def process_manifest(self):
         # Create a DataFrame from the data
         df = pd.DataFrame(self.data)
 
-        # Extract the 'Data owner' and 'Slack ID' values from the split 'description' column
-        data_owner_split = df["description"].str.extract(r"(Data Owner:\s*[A-Z0-9]+)", expand=True)
-        slack_id_split = df["description"].str.extract(r"(Slack Channel ID:\s*[A-Z0-9]+)", expand=True)
-
-        # Assign the extracted values to new columns in the DataFrame
-        df["model_owner"] = data_owner_split
-        df["slack_id"] = slack_id_split
-        df["depends_on"] = df["depends_on"].apply(
-            lambda x: x[0] if len(x) > 0 else None
+        # Plain substring prefilter, so the regexes only run on rows that could possibly match
+        has_owner = df["description"].str.contains("Data Owner:", regex=False, na=False)
+        has_slack_id = df["description"].str.contains("Slack Channel ID:", regex=False, na=False)
+        extracted = pd.DataFrame(index=df.index, columns=["model_owner", "slack_id"])
+
+        # Extract the 'Data owner' and 'Slack ID' values from the 'description' column in one pass
+        has_both = has_owner & has_slack_id
+        if has_both.any():
+            extracted.loc[has_both, ["model_owner", "slack_id"]] = df.loc[
+                has_both, "description"
+            ].str.extract(DESCRIPTION_PATTERN)
+
+        # Fall back to separate passes for rows the combined pattern missed (e.g. keys in reverse order)
+        owner_missed = has_owner & extracted["model_owner"].isna()
+        if owner_missed.any():
+            extracted.loc[owner_missed, "model_owner"] = df.loc[
+                owner_missed, "description"
+            ].str.extract(DATA_OWNER_PATTERN)["model_owner"]
+        slack_id_missed = has_slack_id & extracted["slack_id"].isna()
+        if slack_id_missed.any():
+            extracted.loc[slack_id_missed, "slack_id"] = df.loc[
+                slack_id_missed, "description"
+            ].str.extract(SLACK_ID_PATTERN)["slack_id"]
+
+        # Build the desired columns in one step, so pandas consolidates the blocks once
+        df2 = pd.DataFrame(
+            {
+                "unique_id": df["unique_id"],
+                "node": df["node"],
+                "model_owner": extracted["model_owner"],
+                "slack_id": extracted["slack_id"],
+                "path": df["path"],
+                "depends_on": df["depends_on"],
+            }
         )
 
-        # Select only the desired columns from the DataFrame
-        df2 = df[["unique_id", "node", "model_owner", "slack_id", "path", "depends_on"]]
-
         # Returns the parsed Manifest file, with the 5 cols defined above
         return df2
 
     def lookup_related_node_for_tests(self, df2):
-        for index, row in df2.iterrows():
-            if row["unique_id"].startswith("test"):
-                depends_on_row = df2.loc[df2["unique_id"] == row["depends_on"]]
-                try:
-                    slack_id = depends_on_row.iloc[0]["slack_id"]
-                    df2.at[index, "slack_id_2"] = str(slack_id)
-                except IndexError:
-                    pass
+        # Map each test to the slack_id of the node it depends on in a single pass
+        lookup = dict(zip(df2["unique_id"], df2["slack_id"]))
+        test_mask = df2["unique_id"].str.startswith("test.", na=False)
+        df2.loc[test_mask, "slack_id_2"] = df2.loc[test_mask, "depends_on"].map(lookup)
         return df2
     
     # Set a default_value for the Slack Channel ID here, in case the script doesn't find an ID 
     def merge_slack_ids(self, df2, default_value: str = DEFAULT_SLACK_ID):
         # merge slack_id and slack_id_2 columns
-        df2["slack_id"] = df2["slack_id"].combine_first(df2["slack_id_2"])
-
-        # fill missing values with default_value
-        df2["slack_id"].fillna(default_value, inplace=True)
+        merged = df2["slack_id"].combine_first(df2["slack_id_2"]).to_numpy(dtype=object)
 
-        # fill non-null values that don't start with 'C' with default_value
-        mask = df2["slack_id"].notnull() & (~df2["slack_id"].str.startswith("C"))
-        df2.loc[mask, "slack_id"] = default_value
+        # replace missing values and values that don't start with 'C' with default_value in one pass
+        ok = np.array(
+            [isinstance(x, str) and x.startswith("C") for x in merged], dtype=bool
+        )
+        df2["slack_id"] = pd.Categorical(np.where(ok, merged, default_value))
 
         # This df returns the node model_name, node text, model_owner as specified by the data owner param in the description,
         # the slack id as defined in the description, the model path in your project, and the dependecy nodes
@@ -90,28 +149,30 @@ class RunResultsProcessor:
         self.file_path = file_path
         self.notification_status = notification_status
 
-    def parse_data(self):
-        with open(self.file_path) as f:
-            data = json.load(f)
-
-        # Empty list to write parsed data into
-        rows = []
+    def _iter_results(self):
+        with open(self.file_path, "rb") as f:
+            if ijson is None:
+                yield from json_loads(f.read())["results"]
+            else:
+                # Stream results one at a time instead of holding the whole file in memory
+                yield from ijson.items(f, "results.item")
 
-        # Iterate over the rows of the results and create a dictionary for each row
-        for row in data["results"]:
-            row_dict = {
+    def parse_data(self):
+        # Keep only failures / warn statuses while decoding, so successful rows are never materialized
+        rows = [
+            {
                 "node": row["unique_id"],
                 "status": row["status"],
                 "timing": row["timing"],
                 "result": row["failures"],
                 "message": row["message"],
             }
-
-            # Add the row dictionary to the list
-            rows.append(row_dict)
+            for row in self._iter_results()
+            if row["status"] in self.notification_status
+        ]
 
         # Create dataframe from rows list
-        df = pd.DataFrame(rows)
+        df = pd.DataFrame(rows, columns=RUN_RESULTS_COLUMNS)
 
         return df
 
@@ -119,25 +180,25 @@ class RunResultsProcessor:
         # Call parse_data to get the parsed data as a DataFrame
         df = self.parse_data()
 
+        # Nothing to split when the run produced no flagged results
+        if len(df) == 0:
+            return df
+
         # Split node and create 3 new fields based on split node (unique_id)
         df2 = df["node"].str.split(".", expand=True)
         df["process_type"] = df2[0]
         df["schema_name"] = df2[1]
         df["object_name"] = df2[2]
-        df["clean_node_name"] = df.apply(
-            lambda row: ".".join(
-                [row["process_type"], row["schema_name"], row["object_name"]]
-            ),
-            axis=1,
-        )
+        df["clean_node_name"] = df2[0].str.cat([df2[1], df2[2]], sep=".")
 
-        # Filter to just failures / warn statuses in run log
-        df_flagged = df[df.status.isin(self.notification_status)]
+        # Low-cardinality columns as category, so merging/grouping hashes int codes instead of strings
+        for col in ("status", "process_type", "schema_name"):
+            df[col] = df[col].astype("category")
 
-        return df_flagged
+        return df
 
 
-# Class to Join dataframes
+# Class to Join dataframes, df2 being the manifest result indexed by unique_id
 # I need to rewrite this class to account for joining on depends on for test failures
 class JoinDf:
     def __init__(self, df1, df2):
@@ -145,60 +206,91 @@ class JoinDf:
         self.df2 = df2
 
     def join_dataframes(self):
-        df = pd.merge(self.df1, self.df2, left_on="node", right_on="unique_id")
+        # Skip the merge entirely on the common "no errors" run
+        if self.df1.empty or self.df2.empty:
+            return pd.DataFrame(columns=JOIN_OUTPUT_COLUMNS)
 
-        df = df.iloc[:, [8, 14, 1, 3, 4, 5, 11, 12, 13]]
+        # Project both sides down to the needed columns before joining
+        left = self.df1[
+            ["node", "clean_node_name", "status", "result", "message", "process_type"]
+        ]
+        right = self.df2[["depends_on", "model_owner", "slack_id", "path"]]
 
-        return df
+        # df2 is indexed by unique_id, so join on its index rather than building a hash table per merge
+        df = left.join(right, on="node", how="inner")
+
+        return df[JOIN_OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+# Decoding and walking manifest.json is the expensive part of a run and the file is static during a dbt run,
+# so the records are cached per process, keyed by path and mtime
+@functools.lru_cache(maxsize=4)
+def load_manifest_records(manifest_file_path, mtime_ns, validate=False):
+    with open(manifest_file_path, "rb") as fh:
+        data = json_loads(fh.read())
+
+    if validate:
+        m = Manifest(**data)
+        nodes = (
+            (node, n.description, n.path, n.unique_id, n.depends_on.nodes if n.depends_on else [])
+            for node, n in m.nodes.items()
+        )
+    else:
+        # Only five flat fields are needed per node, so skip model construction entirely
+        nodes = (
+            (node, n["description"], n["path"], n["unique_id"], (n.get("depends_on") or {}).get("nodes") or [])
+            for node, n in data["nodes"].items()
+            if n["resource_type"] in MANIFEST_RESOURCE_TYPES
+        )
+
+    return tuple(
+        (node, description, path, unique_id, deps[0] if deps else None)
+        for node, description, path, unique_id, deps in nodes
+    )
 
 
 # main function to execute above classes and functions
 class DBTLogParser:
-    def __init__(self, manifest_file_path, run_results_file_path, wrap_text=False):
+    def __init__(
+        self, manifest_file_path, run_results_file_path, wrap_text=False, validate=False
+    ):
         self.manifest_file_path = manifest_file_path
         self.run_results_file_path = run_results_file_path
         self.wrap_text = wrap_text
-
-    def _wrap_text(self, row):
-        width = 30
-        if row.name == "message":
-            width = 50
-        return row.map(
-            lambda x: fill(str(x), width=width), na_action="ignore"
-        )  # str(x) to avoid issues wrapping dtypes != str
+        # validate=True runs the manifest through the Pydantic models instead of reading the raw dict
+        self.validate = validate
 
     def dbt_log_parser(self):
         logging.info("Parsing Manifest and run_results!")
-        with open(self.manifest_file_path) as fh:
-            data = json.load(fh)
+        # run_results.json actions, first so green runs never pay for parsing the manifest
+        rr_processor = RunResultsProcessor(self.run_results_file_path)
+        rr_result = rr_processor.process_data()
+        if rr_result.empty:
+            logging.info("No errors on the run_results!!")
+            return pd.DataFrame(columns=JOIN_OUTPUT_COLUMNS)
 
         # manifest.json actions
-        m = Manifest(**data)
-        m2 = [
-            {
-                "node": node,
-                "description": n.description,
-                "path": n.path,
-                "unique_id": n.unique_id,
-                "depends_on": n.depends_on.nodes,
-            }
-            for node, n in m.nodes.items()
-        ]
+        records = load_manifest_records(
+            self.manifest_file_path,
+            os.stat(self.manifest_file_path).st_mtime_ns,
+            self.validate,
+        )
+        m2 = pd.DataFrame.from_records(records, columns=MANIFEST_COLUMNS)
         processor = ManifestProcessor(m2)
         manifest_result = processor.process_manifest()
         lookup_result = processor.lookup_related_node_for_tests(manifest_result)
-        manifest_result = processor.merge_slack_ids(lookup_result)
-
-        # run_results.json actions
-        rr_processor = RunResultsProcessor(self.run_results_file_path)
-        rr_result = rr_processor.process_data()
+        manifest_result = processor.merge_slack_ids(lookup_result).set_index("unique_id")
 
         # join run result df and manifest df
         j = JoinDf(rr_result, manifest_result)
         final_df = j.join_dataframes()
 
         if self.wrap_text and not final_df.empty:
-            final_df = final_df.apply(self._wrap_text)
+            for col in final_df.select_dtypes(include=["object", "string"]):
+                width = 50 if col == "message" else 30
+                # astype(str) to avoid issues wrapping dtypes != str, missing values keep their original object
+                values = final_df[col]
+                final_df[col] = values.where(values.isna(), values.astype(str).str.wrap(width))
         if final_df.empty:
             logging.info("No errors on the run_results!!")
         return final_df
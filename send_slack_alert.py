@@ -4,6 +4,9 @@ from typing import Any, Dict, List, Tuple
 
 # from airflow.providers.slack.operators.slack import SlackAPIPostOperator
 
+# Columns shown in every Slack alert table
+ALERT_COLUMNS = ["model_owner", "path", "status", "depends_on", "message"]
+
 
 def send_slack_message_api(message: str, context: Dict[str, Any], channel: str):
     """sends a slack message to a channel using the slack API (not webhook)"""
@@ -29,12 +32,11 @@ def slack_dbt_error(data, context):
     msg = """<!here> A DBT model or test owned by this team has experienced a warning or failure. <{url}|*Log*>
         ```\n{table} ```
         """
-    for slack_channel in set(data["slack_id"]):
-        filtered_df = data.loc[
-            data["slack_id"] == slack_channel,
-            ["model_owner", "path", "status", "depends_on", "message"],
-        ]
-        table = filtered_df.to_markdown(tablefmt="grid", index=False)
+    for slack_channel, filtered_df in data.groupby("slack_id", sort=False, observed=True)[
+        ALERT_COLUMNS
+    ]:
+        # "simple" skips the grid drawing and renders the same inside a Slack code block
+        table = filtered_df.to_markdown(tablefmt="simple", index=False)
         final_msg = msg.format(table=table, url=context.get("task_instance").log_url)
         send_slack_message_api(
             message=final_msg,